@@ -0,0 +1,401 @@
+"""
+The annotations module contains the array-backed representations of the drawn rectangles and the exported bounding boxes, and functions
+to save and load them. JSON remains the interchange format, but next to every JSON file a binary .npz sidecar is written. The sidecar stores
+the size and modification time of the JSON it was written with, and it is only loaded instead of the JSON while those still match.
+
+"""
+
+import os
+import json
+import contextlib
+import numpy as np
+from pathlib import Path
+
+
+# Rectangles drawn in the player, in display coordinates, together with the tracker position when they were drawn
+RECT_DTYPE = np.dtype([
+    ("left", np.int32),
+    ("top", np.int32),
+    ("right", np.int32),
+    ("bottom", np.int32),
+    ("tracker_position", np.int32),
+    ("category", np.int8)
+])
+
+# Exported bounding boxes, in original video resolution
+BOX_DTYPE = np.dtype([
+    ("left", np.int32),
+    ("top", np.int32),
+    ("right", np.int32),
+    ("bottom", np.int32),
+    ("category", np.int8)
+])
+
+
+def sidecar_path(json_path):
+    """
+    Returns the path of the binary sidecar belonging to the given JSON file.
+
+    """
+
+    return Path(json_path).with_suffix(".npz").as_posix()
+
+
+def json_signature(json_path):
+    """
+    Returns the size and the modification time in nanoseconds of the given JSON file, which identify the version a sidecar was written from.
+
+    Raises
+    ------
+    FileNotFoundError
+        If the JSON file does not exist.
+
+    """
+
+    stat = os.stat(json_path)
+    return np.array([stat.st_size, stat.st_mtime_ns], dtype=np.int64)
+
+
+def write_sidecar(json_path, arrays):
+    """
+    Writes the given arrays to the binary sidecar of the given JSON file, together with the signature of the JSON. The JSON has to be written before.
+
+    """
+
+    np.savez(sidecar_path(json_path), json_signature=json_signature(json_path), **arrays)
+
+
+def load_sidecar(json_path):
+    """
+    Loads the arrays stored in the binary sidecar of the given JSON file.
+
+    Returns
+    -------
+    arrays : dict
+        Arrays stored in the sidecar, or None if there is no sidecar or the JSON was changed since the sidecar was written.
+
+    Raises
+    ------
+    FileNotFoundError
+        If the JSON file does not exist.
+
+    """
+
+    signature = json_signature(json_path)
+    npz_path = sidecar_path(json_path)
+    if not os.path.isfile(npz_path):
+        return None
+
+    with np.load(npz_path) as npz:
+        if "json_signature" not in npz.files or not np.array_equal(npz["json_signature"], signature):
+            return None
+        return {key: npz[key] for key in npz.files if key != "json_signature"}
+
+
+def remove_sidecar(json_path):
+    """
+    Removes the binary sidecar of the given JSON file if it exists.
+
+    """
+
+    with contextlib.suppress(FileNotFoundError):
+        os.remove(sidecar_path(json_path))
+
+
+def rectangles_from_list(rectangles):
+    """
+    Converts rectangles from the JSON representation to a structured array.
+
+    Parameters
+    ----------
+    rectangles : list
+        List of rectangles conforming to the following pattern: [[left, top], [right, bottom], tracker_position, category]
+
+    Returns
+    -------
+    rectangles : numpy.ndarray
+        Structured array of RECT_DTYPE.
+
+    """
+
+    return np.array([(rect[0][0], rect[0][1], rect[1][0], rect[1][1], rect[2], rect[3]) for rect in rectangles], dtype=RECT_DTYPE)
+
+
+def rectangles_to_list(rectangles):
+    """
+    Converts a structured array of rectangles to the JSON representation: [[left, top], [right, bottom], tracker_position, category]
+
+    """
+
+    return [[[left, top], [right, bottom], tracker_position, category] for left, top, right, bottom, tracker_position, category in rectangles.tolist()]
+
+
+def load_config(json_path):
+    """
+    Loads a per-video config from its binary sidecar if it is up-to-date, otherwise from the JSON file.
+
+    Parameters
+    ----------
+    json_path : str
+        Path of the JSON config file.
+
+    Returns
+    -------
+    config : dict
+        Config with the rectangles as a structured array of RECT_DTYPE.
+
+    Raises
+    ------
+    FileNotFoundError
+        If the config JSON does not exist.
+
+    """
+
+    sidecar = load_sidecar(json_path)
+    if sidecar is not None:
+        config = {key: value.item() for key, value in sidecar.items() if key != "rectangles"}
+        config["rectangles"] = sidecar["rectangles"]
+        return config
+
+    with open(json_path) as json_file:
+        config = json.load(json_file)
+    config["rectangles"] = rectangles_from_list(config["rectangles"])
+    return config
+
+
+def save_config(json_path, config):
+    """
+    Writes a per-video config to the given JSON file and its binary sidecar.
+
+    Parameters
+    ----------
+    json_path : str
+        Path of the JSON config file.
+    config : dict
+        Config with the rectangles as a structured array of RECT_DTYPE, all other values are scalars.
+
+    """
+
+    with open(json_path, "w") as outfile:
+        json.dump({**config, "rectangles": rectangles_to_list(config["rectangles"])}, outfile)
+
+    write_sidecar(json_path, config)
+
+
+def to_float(value):
+    """
+    Converts a JSON value to float, missing or non-numeric values become NaN.
+
+    """
+
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        return float("nan")
+
+
+def to_box(annotation):
+    """
+    Converts an annotation dict to a record of BOX_DTYPE.
+
+    Returns
+    -------
+    box : tuple
+        Tuple of (left, top, right, bottom, category), or None if the annotation does not contain a valid bounding box.
+
+    """
+
+    int32 = np.iinfo(np.int32)
+    int8 = np.iinfo(np.int8)
+    try:
+        bbox = annotation["bbox"]
+        if len(bbox) != 4:
+            return None
+        coords = [int(coord) for coord in bbox]
+        category = int(annotation.get("category_id", 0))
+    except (AttributeError, KeyError, TypeError, ValueError, OverflowError):
+        return None
+
+    if not all(int32.min <= coord <= int32.max for coord in coords) or not int8.min <= category <= int8.max:
+        return None
+
+    return (*coords, category)
+
+
+class ExportTable:
+    """
+    Array-backed table of exported images and their bounding boxes. The boxes of every image are stored in a single structured array,
+    the boxes of image i are boxes[offsets[i]:offsets[i + 1]]. Indexing the table returns the dicts that are stored in the export JSON.
+    When the table was loaded from JSON that cannot be restored exactly from the arrays (e.g. written by another tool or edited by hand),
+    the original dicts are kept and returned unchanged, so keys the table does not store are not lost.
+
+    Parameters
+    ----------
+    file_names : numpy.ndarray
+        Absolute paths of the exported images.
+    image_ids : numpy.ndarray
+        Ids of the exported images.
+    widths : numpy.ndarray
+        Widths of the exported images.
+    heights : numpy.ndarray
+        Heights of the exported images.
+    offsets : numpy.ndarray
+        Index of the first box of every image in boxes, followed by the total number of boxes.
+    boxes : numpy.ndarray
+        Structured array of BOX_DTYPE.
+    dicts : list (dict)
+        Original dicts of the images, None for images that were loaded from a sidecar.
+
+    """
+
+    def __init__(self, file_names, image_ids, widths, heights, offsets, boxes, dicts=None):
+        self.file_names = file_names
+        self.image_ids = image_ids
+        self.widths = widths
+        self.heights = heights
+        self.offsets = offsets
+        self.boxes = boxes
+        self.dicts = dicts if dicts is not None else [None] * len(file_names)
+
+    @classmethod
+    def from_dicts(cls, dataset_dicts):
+        """
+        Creates a table from dataset dicts as they are stored in the export JSON. Only "file_name" is required, the arrays are filled with
+        defaults for missing keys. Boxes are only used for drawing, so missing categories default to 0, and bounding boxes that do not fit
+        BOX_DTYPE are left out. The original dicts are kept, and such images prevent writing a sidecar.
+
+        """
+
+        boxes = []
+        counts = []
+        for img in dataset_dicts:
+            count = 0
+            for annotation in img.get("annotations", []):
+                box = to_box(annotation)
+                if box is not None:
+                    boxes.append(box)
+                    count += 1
+            counts.append(count)
+
+        return cls(
+            file_names=np.array([img["file_name"] for img in dataset_dicts], dtype=str),
+            image_ids=np.array([str(img.get("image_id", "")) for img in dataset_dicts], dtype=str),
+            widths=np.array([to_float(img.get("width")) for img in dataset_dicts], dtype=np.float64),
+            heights=np.array([to_float(img.get("height")) for img in dataset_dicts], dtype=np.float64),
+            offsets=np.concatenate(([0], np.cumsum(counts, dtype=np.int64))),
+            boxes=np.array(boxes, dtype=BOX_DTYPE),
+            dicts=list(dataset_dicts)
+        )
+
+    @classmethod
+    def load(cls, json_path):
+        """
+        Loads the table of an export from its binary sidecar if it is up-to-date, otherwise from the JSON file.
+
+        """
+
+        sidecar = load_sidecar(json_path)
+        if sidecar is not None:
+            return cls(**sidecar)
+
+        with open(json_path) as json_file:
+            table = cls.from_dicts(json.load(json_file))
+
+        # Write a sidecar for the next load, the dicts are not needed anymore if it could be written
+        try:
+            if table.save(json_path):
+                table.dicts = [None] * len(table)
+        except OSError as e:
+            print(f"Writing sidecar of {json_path} failed: {e}")
+
+        return table
+
+    @classmethod
+    def concatenate(cls, tables):
+        """
+        Joins multiple tables into one, keeping their order.
+
+        """
+
+        # Shift the offsets of every table by the number of boxes in the tables before it
+        offsets = [np.array([0], dtype=np.int64)]
+        box_count = 0
+        for table in tables:
+            offsets.append(table.offsets[1:] + box_count)
+            box_count += len(table.boxes)
+
+        return cls(
+            file_names=np.concatenate([table.file_names for table in tables] or [np.array([], dtype=str)]),
+            image_ids=np.concatenate([table.image_ids for table in tables] or [np.array([], dtype=str)]),
+            widths=np.concatenate([table.widths for table in tables] or [np.array([], dtype=np.float64)]),
+            heights=np.concatenate([table.heights for table in tables] or [np.array([], dtype=np.float64)]),
+            offsets=np.concatenate(offsets),
+            boxes=np.concatenate([table.boxes for table in tables] or [np.array([], dtype=BOX_DTYPE)]),
+            dicts=[img for table in tables for img in table.dicts]
+        )
+
+    def save(self, json_path):
+        """
+        Writes the table to the binary sidecar of the given export JSON. The JSON itself has to be written before. The sidecar is only written
+        if every image can be restored from it exactly as it is in the JSON, otherwise an existing sidecar is removed, so the JSON is always used.
+
+        Returns
+        -------
+        saved : bool
+            True if the sidecar was written.
+
+        """
+
+        for index, img in enumerate(self.dicts):
+            if img is not None and json.dumps(self.build_dict(index)) != json.dumps(img):
+                remove_sidecar(json_path)
+                return False
+
+        write_sidecar(json_path, {
+            "file_names": self.file_names,
+            "image_ids": self.image_ids,
+            "widths": self.widths,
+            "heights": self.heights,
+            "offsets": self.offsets,
+            "boxes": self.boxes
+        })
+        return True
+
+    def boxes_for(self, index):
+        """
+        Returns the bounding boxes of the image at the given index as a structured array of BOX_DTYPE.
+
+        """
+
+        return self.boxes[self.offsets[index]:self.offsets[index + 1]]
+
+    def build_dict(self, index):
+        """
+        Builds the dict of the image at the given index from the arrays, following the schema of the JSON written by the player.
+
+        """
+
+        return {
+            "file_name": str(self.file_names[index]),
+            "width": float(self.widths[index]),
+            "height": float(self.heights[index]),
+            "image_id": str(self.image_ids[index]),
+            "annotations": [{
+                "bbox": [left, top, right, bottom],
+                "bbox_mode": 0,
+                "category_id": category
+            } for left, top, right, bottom, category in self.boxes_for(index).tolist()]
+        }
+
+    def __len__(self):
+        return len(self.file_names)
+
+    def __iter__(self):
+        return (self[i] for i in range(len(self)))
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return [self[i] for i in range(*index.indices(len(self)))]
+
+        img = self.dicts[index]
+        return img if img is not None else self.build_dict(index)
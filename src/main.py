@@ -1,19 +1,41 @@
 import os
 import sys
+import time
 from pathlib import Path
-from player import Player
-from storage import Storage
 
 
-storage = Storage()
-recording_set_id = sys.argv[1]
-videos_path = os.path.join(Path().parent.absolute(), "videos", recording_set_id)
-storage.download_videos(videos_path=videos_path)
+# Guard is needed, because export worker processes may import this module when they are spawned
+if __name__ == "__main__":
+    # Measure time from launch to the first frame on screen, heavy modules are imported after this point
+    launch_time = time.perf_counter()
+    from player import Player
+    from storage import Storage
 
-if not os.path.isdir(videos_path):
-    os.makedirs(videos_path, exist_ok=True)
+    recording_set_id = sys.argv[1]
+    export_workers = int(sys.argv[sys.argv.index("--export-workers") + 1]) if "--export-workers" in sys.argv[2:] else os.cpu_count()
+    videos_path = os.path.join(Path().parent.absolute(), "videos", recording_set_id)
 
-avi_files = [f.path for f in os.scandir(videos_path) if os.path.splitext(f.name)[1] == ".avi"]
+    if not os.path.isdir(videos_path):
+        os.makedirs(videos_path, exist_ok=True)
 
-for avi_file in avi_files:
-    Player(avi_file, export_id=recording_set_id).start()
+    def list_avi_files():
+        return [f.path for f in os.scandir(videos_path) if os.path.splitext(f.name)[1] == ".avi"]
+
+    # Local videos are used without listing the bucket, unless a refresh is requested. In offline mode the bucket is never listed.
+    avi_files = list_avi_files()
+    if "--offline" in sys.argv[2:]:
+        print("Offline mode, using local videos only.")
+    elif len(avi_files) > 0 and "--refresh" not in sys.argv[2:]:
+        print(f"Using {len(avi_files)} local videos, run with --refresh to download new videos.")
+    else:
+        try:
+            Storage().download_videos(videos_path=videos_path)
+        except Exception as e:
+            if len(avi_files) == 0:
+                raise
+            print(f"Downloading videos failed ({e}), using local videos only.")
+        avi_files = list_avi_files()
+
+    for avi_file in avi_files:
+        Player(avi_file, export_id=recording_set_id, export_workers=export_workers, launch_time=launch_time).start()
+        launch_time = None
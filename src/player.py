@@ -8,8 +8,13 @@ import os
 import cv2
 import math
 import json
+import time
+import numpy as np
+import multiprocessing
 import concurrent.futures
 from pathlib import Path
+from annotations import RECT_DTYPE, ExportTable, load_config, save_config
+from startup import log_startup_time
 
 
 class Player:
@@ -32,20 +37,31 @@ class Player:
         Number of skipped frames between saved frames when creating the dataset.
     export_offset : int
         Number of frames to offset which frames are exported. Useful to avoid exporting blurry images.
+    export_workers : int
+        Number of processes used to grab and save the exported frames. With more than one, the frames to export are split into contiguous chunks,
+        each decoded sequentially by its own process.
+    min_frames_per_worker : int
+        Minimum number of exported frames per worker process. Starting a worker takes about as long as grabbing dozens of frames,
+        so fewer workers are used if there are not enough frames, and short exports are done without workers.
+    launch_time : float
+        Value of time.perf_counter() when the application was launched. If provided, the time until the first frame is displayed is logged.
 
     """
 
-    def __init__(self, video_path, export_id, window_width=1040.0, radius=1000.0, max_angle=120.0, export_interval=18, export_offset=3):
+    def __init__(self, video_path, export_id, window_width=1040.0, radius=1000.0, max_angle=120.0, export_interval=18, export_offset=3, export_workers=1,
+                 min_frames_per_worker=100, launch_time=None):
         self.video_path = video_path
         self.window_width = window_width
         self.export_id = export_id
+        self.export_workers = export_workers
+        self.min_frames_per_worker = min_frames_per_worker
+        self.launch_time = launch_time
 
-        # Load config JSON if it exists
+        # Load config JSON (or its binary sidecar) if it exists
         self.json_config_path = os.path.join(os.path.dirname(self.video_path), f"{os.path.splitext(os.path.basename(video_path))[0]}.json")
         try:
-            with open(self.json_config_path) as json_file:
-                config = json.load(json_file)
-                config_found = True
+            config = load_config(self.json_config_path)
+            config_found = True
         except FileNotFoundError:
             config_found = False
 
@@ -53,7 +69,7 @@ class Player:
         self.max_angle = config["max_angle"] if config_found else max_angle
         self.export_interval = config["export_interval"] if config_found else export_interval
         self.export_offset = config["export_offset"] if config_found else export_offset
-        self.rectangles = config["rectangles"] if config_found else []
+        self.rectangles = config["rectangles"] if config_found else np.empty(0, dtype=RECT_DTYPE)
 
         self.window = video_path
         self.status = "stay"
@@ -131,7 +147,7 @@ class Player:
             right = max(self.downX, x)
             top = min(self.downY, y)
             bottom = max(self.downY, y)
-            self.rectangles.append(((left, top), (right, bottom), self.tracker_position, category))
+            self.rectangles = np.append(self.rectangles, np.array([(left, top, right, bottom, self.tracker_position, category)], dtype=RECT_DTYPE))
 
         # Set flag to redraw frame after new rectangle added
         self.rerender = True
@@ -143,9 +159,9 @@ class Player:
 
         Parameters
         ----------
-        old_rect_points : tuple
-            Contains coordinates of top left corner (index 0), cooridnates of bottom right corner (index 1),
-            and trackbar position when the box was srawn (index 2).
+        old_rect_points : numpy.void
+            Record of RECT_DTYPE, containing coordinates of top left and bottom right corners, trackbar position when the box was drawn,
+            and category.
         tracker_position : int
             Tracker position (frame index) for which the rectangle position will be calculated.
 
@@ -162,18 +178,18 @@ class Player:
         # Retrieve frame dimensions
         half_w, half_h = self.frame_dims[0] / 2, self.frame_dims[1] / 2
 
-        # Retrieve rectangle data
-        box_w = old_rect_points[1][0] - old_rect_points[0][0]
-        box_h = old_rect_points[1][1] - old_rect_points[0][1]
-        tracker_position_when_drawn = old_rect_points[2]
+        # Retrieve rectangle data as Python numbers
+        left, top, right, bottom, tracker_position_when_drawn, category = old_rect_points.tolist()
+        box_w = right - left
+        box_h = bottom - top
 
         # Convert rackbar position to angle and calculate new angle comapred to beginning of video
         angle_old = self.max_angle * tracker_position_when_drawn / self.total_frames
         angle_new = self.max_angle * tracker_position / self.total_frames
 
         # Calculate center point of rectangle to move
-        x1 = old_rect_points[0][0] + box_w / 2
-        y1 = old_rect_points[0][1] + box_h / 2
+        x1 = left + box_w / 2
+        y1 = top + box_h / 2
 
         # Calculate old point coordinates in polar coordinate system
         gamma_old = math.atan((half_w - x1) / (self.radius + half_h - y1 + 0.000001))
@@ -189,7 +205,7 @@ class Player:
         y2 = self.radius + half_h - (math.cos(gamma_new) * polar_radius)
 
         # Calculate top left and bottom right corners from center, width and height
-        new_coords = [(int(x2 - box_w / 2), int(y2 - box_h / 2)), (int(x2 + box_w / 2), int(y2 + box_h / 2)), old_rect_points[2], old_rect_points[3]]
+        new_coords = [(int(x2 - box_w / 2), int(y2 - box_h / 2)), (int(x2 + box_w / 2), int(y2 + box_h / 2)), tracker_position_when_drawn, category]
 
         return new_coords
 
@@ -277,6 +293,11 @@ class Player:
                     # Display grabbed image
                     cv2.imshow(self.window, self.frame)
 
+                    # Log cold start time once
+                    if self.launch_time is not None:
+                        log_startup_time("player", self.launch_time)
+                        self.launch_time = None
+
                     # Reset flag
                     self.rerender = False
 
@@ -323,7 +344,7 @@ class Player:
                     self.status = "exit"
 
                 if self.status == "remove_last":
-                    self.rectangles.pop()
+                    self.rectangles = self.rectangles[:-1]
                     self.status = "stay"
 
                 if self.status == "exit":
@@ -354,7 +375,8 @@ class Player:
         This function is responsible for creating a dataset which later can be used for training. It will export frames defined by export_offset and export_interval.
         Only bounding boxes wholly within the viewport are included in the exported JSON. The grabbed images will be saved to the exports folder.
         The JSON file containing the annotations will be also saved there. Another JSON file will be saved to the videos folder,
-        so the parameters and rectangles can be loaded if a previously labeled video is opened again.
+        so the parameters and rectangles can be loaded if a previously labeled video is opened again. Both JSON files get a binary .npz sidecar,
+        which is faster to load.
 
         Returns
         -------
@@ -375,7 +397,7 @@ class Player:
 
         # Loop though all the frames
         dataset_dicts = []
-        exported_frames_count = 0
+        frame_indices = []
         for frame_index in range(int(self.total_frames)):
             # Only export a frame when the frame index is multiple of export interval (+offset)
             if (self.export_offset + frame_index) % self.export_interval == 0:
@@ -392,14 +414,11 @@ class Player:
                 if len(rectangles_to_export) == 0:
                     continue
 
-                # Grab the current frame from the video
-                self.video.set(cv2.CAP_PROP_POS_FRAMES, frame_index)
-                frame_grab_success, frame = self.video.read()
-
                 # Construct file path
                 file_path = os.path.join(export_path, f"{video_name}_{frame_index}.jpg")
 
                 # Generate and append dataset dictionary for rectangles to be exported
+                frame_indices.append(frame_index)
                 dataset_dicts.append({
                     "file_name": file_path,
                     "width": frame_w,
@@ -412,31 +431,104 @@ class Player:
                     } for rect in rectangles_to_export]
                 })
 
+        # Grab and write frames to exports folder
+        grab_start_time = time.perf_counter()
+        exported_frames_count = 0
+        workers_used = 1
+        workers = min(self.export_workers, len(frame_indices) // self.min_frames_per_worker)
+        if workers > 1:
+            # Split frame indices into contiguous chunks, each of them is decoded sequentially by a separate process
+            chunk_size = math.ceil(len(frame_indices) / workers)
+            chunks = [frame_indices[i:i + chunk_size] for i in range(0, len(frame_indices), chunk_size)]
+            workers_used = len(chunks)
+            # Workers are spawned, because forking this process with the GUI and OpenCV threads running can hang them
+            with concurrent.futures.ProcessPoolExecutor(max_workers=len(chunks), mp_context=multiprocessing.get_context("spawn")) as executor:
+                futures = [executor.submit(export_frames, self.video_path, chunk, export_path) for chunk in chunks]
+                for future in futures:
+                    exported_frames_count += future.result()
+        else:
+            for frame_index in frame_indices:
+                # Grab the current frame from the video
+                self.video.set(cv2.CAP_PROP_POS_FRAMES, frame_index)
+                frame_grab_success, frame = self.video.read()
+
                 # Write grabbed frame to exports folder
                 if frame_grab_success:
-                    cv2.imwrite(file_path, frame)
+                    cv2.imwrite(os.path.join(export_path, f"{video_name}_{frame_index}.jpg"), frame)
                     exported_frames_count += 1
                     print(f"Successfully exported {video_name}_{frame_index}.jpg!")
                 else:
                     raise Exception(f"Frame grab failed at index {frame_index} while exporting.")
 
-        # Write dataset JSON to exports folder
-        with open(os.path.join(export_path, f"{video_name}.json"), "w") as outfile:
+        print(f"Grabbed {exported_frames_count} frames in {time.perf_counter() - grab_start_time:.2f}s using {workers_used} worker(s).")
+
+        # Write dataset JSON and its sidecar to exports folder
+        dataset_json_path = os.path.join(export_path, f"{video_name}.json")
+        with open(dataset_json_path, "w") as outfile:
             print("Writing JSON dataset file...")
             json.dump(dataset_dicts, outfile)
             print("JSON dataset write finished!")
+        ExportTable.from_dicts(dataset_dicts).save(dataset_json_path)
 
         # Write config JSON to videos folder to load rectangles and slider values if the same video is reopened later
-        with open(self.json_config_path, "w") as outfile:
-            print("Writing JSON config file...")
-            config = {
-                "rectangles": self.rectangles,
-                "radius": self.radius,
-                "max_angle": self.max_angle,
-                "export_interval": self.export_interval,
-                "export_offset": self.export_offset
-            }
-            json.dump(config, outfile)
-            print("JSON config write finished!")
+        print("Writing JSON config file...")
+        save_config(self.json_config_path, {
+            "rectangles": self.rectangles,
+            "radius": self.radius,
+            "max_angle": self.max_angle,
+            "export_interval": self.export_interval,
+            "export_offset": self.export_offset
+        })
+        print("JSON config write finished!")
 
         return exported_frames_count
+
+
+def export_frames(video_path, frame_indices, export_path):
+    """
+    A function to be executed by ProcessPoolExecutor. It opens its own capture of the video, seeks once to the first frame of the chunk,
+    and from there decodes sequentially, saving the frames with the given indices to the exports folder.
+
+    Parameters
+    ----------
+    video_path : str
+        Path of the video file to export frames from.
+    frame_indices : list (int)
+        Ascending, contiguous chunk of frame indices to be exported.
+    export_path : str
+        Absolute path to the folder where the exported frames are saved.
+
+    Returns
+    -------
+    exported_frames_count : int
+        Number of exported frames.
+
+    """
+
+    video = cv2.VideoCapture(video_path)
+    video_name = os.path.basename(video_path)
+
+    # Seek only once, to the beginning of the chunk
+    video.set(cv2.CAP_PROP_POS_FRAMES, frame_indices[0])
+    position = frame_indices[0]
+
+    exported_frames_count = 0
+    for frame_index in frame_indices:
+        # Skip frames between exported ones without converting them to images
+        while position < frame_index:
+            video.grab()
+            position += 1
+
+        frame_grab_success, frame = video.read()
+        position += 1
+
+        if frame_grab_success:
+            cv2.imwrite(os.path.join(export_path, f"{video_name}_{frame_index}.jpg"), frame)
+            exported_frames_count += 1
+            print(f"Successfully exported {video_name}_{frame_index}.jpg!")
+        else:
+            raise Exception(f"Frame grab failed at index {frame_index} while exporting.")
+
+    video.release()
+
+    return exported_frames_count
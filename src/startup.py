@@ -0,0 +1,43 @@
+"""
+The startup module keeps track of how long the tools take from launch until the first image is on screen. Every measurement is printed
+and appended to a CSV log in the working directory, so cold start times can be compared across runs and versions.
+
+"""
+
+import os
+import time
+from datetime import datetime
+from pathlib import Path
+
+
+def log_startup_time(tool, launch_time, log_path=None):
+    """
+    Prints the time elapsed since launch and appends it to the startup log.
+
+    Parameters
+    ----------
+    tool : str
+        Name of the tool that was started, e.g. "player" or "verify".
+    launch_time : float
+        Value of time.perf_counter() when the tool was launched.
+    log_path : str
+        Path of the CSV log. Defaults to startup_times.csv in the working directory.
+
+    Returns
+    -------
+    elapsed : float
+        Seconds elapsed since launch.
+
+    """
+
+    elapsed = time.perf_counter() - launch_time
+    print(f"First image of {tool} displayed {elapsed:.2f}s after launch.")
+
+    log_path = log_path or os.path.join(Path().parent.absolute(), "startup_times.csv")
+    write_header = not os.path.isfile(log_path)
+    with open(log_path, "a") as log_file:
+        if write_header:
+            log_file.write("timestamp,tool,seconds\n")
+        log_file.write(f"{datetime.now().isoformat(timespec='seconds')},{tool},{elapsed:.3f}\n")
+
+    return elapsed
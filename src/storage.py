@@ -1,30 +1,82 @@
 """
-The storage module is responsible for handling downloads and uploads from/to Amazon S3.
+The storage module is responsible for handling downloads and uploads from/to Amazon S3. Boto3 and FFmpy are only imported when they are first needed,
+so the tools start quickly and work without network access when nothing has to be downloaded or uploaded.
 
 """
 
 
 import os
-import boto3
+import time
+import contextlib
 import concurrent.futures
-from ffmpy import FFmpeg
 from pathlib import Path
 
 
+# Error codes of S3 responses which are worth retrying, besides server errors (5xx)
+RETRIED_ERROR_CODES = {"PreconditionFailed", "RequestTimeout", "SlowDown", "Throttling", "ThrottlingException", "RequestThrottled"}
+
+
 class Storage:
     """
-    The Storage call contains methods to manage uploads and downloads.
+    The Storage call contains methods to manage uploads and downloads. The S3 buckets are created on first use.
+
+    Parameters
+    ----------
+    endpoint_url : str
+        URL of the S3 endpoint. Defaults to the S3_ENDPOINT_URL environment variable, if that is not set either, AWS S3 is used.
+        Useful to run against a local S3 compatible server, like MinIO or moto.
+    max_retries : int
+        Number of times an interrupted download is resumed before giving up.
+    chunk_size : int
+        Number of bytes read from S3 before they are written to disk.
 
     """
 
-    def __init__(self):
-        self.videos_bucket = boto3.resource("s3").Bucket("sorterbot-training-videos")
+    def __init__(self, endpoint_url=None, max_retries=5, chunk_size=1024 * 1024):
+        self.endpoint_url = endpoint_url or os.environ.get("S3_ENDPOINT_URL")
+        self.max_retries = max_retries
+        self.chunk_size = chunk_size
         self.datasets_path = os.path.join(Path().parent.absolute(), "datasets")
-        self.datasets_bucket = boto3.resource("s3").Bucket("sorterbot-datasets")
+        self._videos_bucket = None
+        self._datasets_bucket = None
+
+    @property
+    def videos_bucket(self):
+        if self._videos_bucket is None:
+            self._videos_bucket = self.get_bucket("sorterbot-training-videos")
+        return self._videos_bucket
+
+    @property
+    def datasets_bucket(self):
+        if self._datasets_bucket is None:
+            self._datasets_bucket = self.get_bucket("sorterbot-datasets")
+        return self._datasets_bucket
+
+    def get_bucket(self, bucket_name):
+        """
+        Creates an S3 resource and returns the requested bucket. Boto3 is imported here, because importing it and setting up a session
+        noticeably slows down startup, even when S3 is not used at all.
+
+        Parameters
+        ----------
+        bucket_name : str
+            Name of the S3 bucket.
+
+        Returns
+        -------
+        bucket : object
+            Boto3 Bucket resource.
+
+        """
+
+        import boto3
+
+        return boto3.resource("s3", endpoint_url=self.endpoint_url).Bucket(bucket_name)
 
     def download_videos(self, videos_path):
         """
-        Lists objects in videos buckets and launches tasks to download them.
+        Lists objects in videos buckets and launches tasks to download them. If any download fails, the first error is raised
+        after every task finished.
 
         Parameters
         ----------
@@ -34,10 +86,14 @@ class Storage:
         """
 
         objects = [obj.key for obj in self.videos_bucket.objects.all() if os.path.dirname(obj.key) == os.path.basename(videos_path)]
+        if len(objects) == 0:
+            return
+
         with concurrent.futures.ThreadPoolExecutor(max_workers=len(objects)) as executor:
-            for obj in objects:
-                executor.submit(self.download_and_convert_video, obj, videos_path)
-        executor.shutdown(wait=True)
+            futures = [executor.submit(self.download_and_convert_video, obj, videos_path) for obj in objects]
+
+        for future in futures:
+            future.result()
 
     def download_and_convert_video(self, obj, videos_path):
         """
@@ -53,13 +109,101 @@ class Storage:
 
         """
 
+        from ffmpy import FFmpeg
+
         video_path = os.path.join(videos_path, os.path.basename(obj))
         video_path_avi = Path(video_path).with_suffix('.avi').resolve().as_posix()
         if not os.path.isfile(video_path):
-            self.videos_bucket.download_file(obj, video_path)
+            self.download_file(obj, video_path)
         if not os.path.isfile(video_path_avi):
             FFmpeg(inputs={video_path: None}, outputs={video_path_avi: "-c:v libx264"}).run()
 
+    def download_file(self, obj, file_path):
+        """
+        Downloads an object from the videos bucket to a temporary .part file, which is renamed to the given path only when the download
+        is complete, so an interrupted transfer never leaves a partial file at the final path. The ETag of the object is stored next to the
+        .part file, and if both exist and the ETag still matches, the download is resumed from the end of the .part file using a ranged request
+        pinned to that ETag. Otherwise the partial download is discarded. Connection errors, throttling and server errors are retried
+        with exponential backoff, other errors (e.g. missing object or access denied) are raised immediately.
+
+        Parameters
+        ----------
+        obj : str
+            Key of the AWS S3 object to be downloaded.
+        file_path : str
+            Absolute path where the downloaded file should be saved.
+
+        """
+
+        import botocore.exceptions
+        from urllib3.exceptions import ProtocolError, ReadTimeoutError
+
+        # Connection resets and timeouts while streaming the body are raised by urllib3 on older botocore versions
+        retried_errors = (
+            botocore.exceptions.ConnectionError,
+            botocore.exceptions.HTTPClientError,
+            botocore.exceptions.ClientError,
+            getattr(botocore.exceptions, "ResponseStreamingError", botocore.exceptions.HTTPClientError),
+            ProtocolError,
+            ReadTimeoutError,
+            IOError
+        )
+
+        part_path = f"{file_path}.part"
+        etag_path = f"{part_path}.etag"
+        s3_object = self.videos_bucket.Object(obj)
+
+        for attempt in range(self.max_retries + 1):
+            try:
+                # Refresh size and ETag, the object might have been replaced since the last attempt
+                s3_object.reload()
+                total_size = s3_object.content_length
+
+                # Resume only if the partial file was started from the current version of the object
+                stored_etag = None
+                if os.path.isfile(part_path) and os.path.isfile(etag_path):
+                    with open(etag_path) as etag_file:
+                        stored_etag = etag_file.read()
+                if stored_etag != s3_object.e_tag or os.path.getsize(part_path) > total_size:
+                    for path in (part_path, etag_path):
+                        with contextlib.suppress(FileNotFoundError):
+                            os.remove(path)
+                    stored_etag = s3_object.e_tag
+                    with open(etag_path, "w") as etag_file:
+                        etag_file.write(stored_etag)
+                    open(part_path, "wb").close()
+
+                offset = os.path.getsize(part_path)
+                if offset < total_size:
+                    # IfMatch makes sure that the resumed bytes belong to the same version of the object as the partial file
+                    body = s3_object.get(Range=f"bytes={offset}-", IfMatch=stored_etag)["Body"]
+                    with open(part_path, "ab") as outfile:
+                        for chunk in body.iter_chunks(chunk_size=self.chunk_size):
+                            outfile.write(chunk)
+
+                if os.path.getsize(part_path) != total_size:
+                    raise IOError(f"Incomplete download of {obj}: {os.path.getsize(part_path)} of {total_size} bytes.")
+
+                os.replace(part_path, file_path)
+                os.remove(etag_path)
+                return
+            except retried_errors as e:
+                if isinstance(e, botocore.exceptions.ClientError):
+                    error_code = e.response.get("Error", {}).get("Code")
+                    status_code = e.response.get("ResponseMetadata", {}).get("HTTPStatusCode", 0)
+                    if error_code not in RETRIED_ERROR_CODES and status_code < 500:
+                        raise
+                    if error_code == "PreconditionFailed":
+                        # Object changed since the partial download started, discard the partial file
+                        for path in (part_path, etag_path):
+                            with contextlib.suppress(FileNotFoundError):
+                                os.remove(path)
+                if attempt == self.max_retries:
+                    raise
+                delay = 2 ** attempt
+                print(f"Download of {obj} failed ({e}), retrying in {delay}s...")
+                time.sleep(delay)
+
     def upload_dataset(self, dataset_path, only_json=False):
         """
         Function to upload a ready dataset (images and JSON) to the datasets bucket. It is called after the verify module was used to manually confirm 
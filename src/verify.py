@@ -5,38 +5,68 @@ or the objects out of their bounding boxes due to inconsistent movements of the
 It can process multiple export folders at once. The IDs for these folders has to be provided at startup. After all the files in these folder are read in,
 a UI will appear showing the first picture and the generated bounding boxes over the objects. If the picture looks alright, press Num+, and it will be added
 to the dataset. If a picture was added by mistake, press Num-, and the last picture will be removed and show again to revise the decision. If any other key
-is pressed (Num Enter conveniently), the current picture is skipped and the next one is shown. After every picture has been added or skipped, the images
+is pressed (Num Enter conveniently), the current picture is skipped and the next one is shown. If the --mosaic flag is provided after the export IDs, a grid
+of thumbnails is shown instead, one page at a time. Every tile is accepted by default, clicking a tile toggles it, Num+ adds the accepted tiles of the page
+to the dataset, Num- reverts the previous page and any other key skips the whole page. The thumbnails are pre-rendered in the background and cached on disk,
+so paging does not have to wait for image decoding. After every picture has been added or skipped, the images
 will be copied to the dataset folder (divided into train and validation set) and one JSON file will be created for the training and validation sets.
-At the end of the process, the generated dataset will be uploaded to the datasets S3 bucket.
+At the end of the process, the generated dataset will be uploaded to the datasets S3 bucket, unless the --offline flag is provided.
 
 """
 
+import time
+
+# Measure time from launch to the first image on screen, so it has to be taken before the heavy imports below
+launch_time = time.perf_counter()
+
 import os
 import sys
 import cv2
 import json
 import random
+import hashlib
+import tempfile
+import numpy as np
+import concurrent.futures
 from pathlib import Path
 from shutil import copyfile
 from storage import Storage
+from annotations import ExportTable
+from startup import log_startup_time
 
 
 class Verify:
     """
     Verify class to contain functions which verify and combine multiple exports into one dataset.
 
+    Parameters
+    ----------
+    launch_time : float
+        Value of time.perf_counter() when the application was launched. If provided, the time until the first image is displayed is logged.
+
     """
 
-    def __init__(self):
+    def __init__(self, grid_rows=3, grid_cols=4, thumb_width=320, prefetch_pages=3, launch_time=None):
         cv2.namedWindow("window", flags=cv2.WINDOW_GUI_NORMAL + cv2.WINDOW_AUTOSIZE)
         cv2.moveWindow("window", 250, 50)
-
+        cv2.setMouseCallback("window", self.onMouseClick)
+
+        self.grid_rows = grid_rows
+        self.grid_cols = grid_cols
+        self.thumb_width = thumb_width
+        self.thumb_height = None
+        self.prefetch_pages = prefetch_pages
+        self.rejected_tiles = set()
+        self.mosaic_changed = False
+
+        self.launch_time = launch_time
+        self.offline = "--offline" in sys.argv[2:]
         self.storage = Storage()
         self.export_ids = sys.argv[1].split(",")
         self.datasets_path = os.path.join(Path().parent.absolute(), "datasets")
         self.verified_data = []
 
-    def run(self, manual_verification=True):
+    def run(self, manual_verification=True, mosaic=False):
         """
         Function to run the verification process.
 
@@ -45,27 +75,33 @@ class Verify:
         manual_verification : bool
             Flag to manually verify images or just generate JSON and upload it from previosly verified images that
             were already copied to the dataset folder.
+        mosaic : bool
+            Flag to verify a grid of thumbnails per keypress instead of one image at a time.
 
         """
 
         self.load_json()
         if manual_verification:
-            self.verify_images()
+            if mosaic:
+                self.verify_mosaic()
+            else:
+                self.verify_images()
         self.export_to_dataset(manual_verification=manual_verification)
 
     def load_json(self):
         """
-        Function that loads every JSON file in the specified exports folders and loads the data stored in them.
+        Function that loads every JSON file in the specified exports folders and loads the data stored in them into one ExportTable.
+        If a JSON file has an up-to-date binary sidecar, the sidecar is loaded instead.
 
         """
 
-        self.all_data = []
+        tables = []
         for export_id in self.export_ids:
             exports_path = os.path.join(Path().parent.absolute(), "exports", export_id)
             json_paths = [f.path for f in os.scandir(exports_path) if os.path.splitext(f.name)[1] == ".json"]
             for json_path in json_paths:
-                with open(json_path) as json_file:
-                    self.all_data += json.load(json_file)
+                tables.append(ExportTable.load(json_path))
+        self.all_data = ExportTable.concatenate(tables)
 
     def verify_images(self):
         """
@@ -81,7 +117,7 @@ class Verify:
                 break
 
             img = self.all_data[i]
-            key_code = self.display_image(img)
+            key_code = self.display_image(i)
 
             if key_code == 43:
                 # Add to dataset if the pressed key was "+" and move to next image
@@ -107,15 +143,190 @@ class Verify:
                 actions[i] = "skipped"
                 i += 1
 
-    def display_image(self, img):
+    def onMouseClick(self, event, x, y, flags, param):
+        """
+        Event handler that toggles the tile under the cursor between accepted and rejected in mosaic mode.
+
+        """
+
+        if event != cv2.EVENT_LBUTTONUP or self.thumb_height is None:
+            return
+
+        tile = (y // self.thumb_height) * self.grid_cols + x // self.thumb_width
+        if tile in self.rejected_tiles:
+            self.rejected_tiles.remove(tile)
+        else:
+            self.rejected_tiles.add(tile)
+        self.mosaic_changed = True
+
+    def verify_mosaic(self):
+        """
+        Function that loops through the images from the loaded JSON files page by page, shows them as a grid of thumbnails, and based on the user input,
+        saves the accepted tiles of each page to the dataset or skips the whole page.
+
+        """
+
+        page_size = self.grid_rows * self.grid_cols
+        page_count = (len(self.all_data) + page_size - 1) // page_size
+
+        # Thumbnails of the current page and the next few pages are rendered in the background, keyed by image index
+        with concurrent.futures.ThreadPoolExecutor(max_workers=os.cpu_count()) as executor:
+            thumbnails = {}
+
+            page = 0
+            actions = {}
+            while True:
+                if page == page_count:
+                    break
+
+                start = page * page_size
+                end = min(start + page_size, len(self.all_data))
+
+                # Release thumbnails outside of the prefetch window, going back re-reads them from the disk cache
+                prefetch_window = range(start, min(start + (self.prefetch_pages + 1) * page_size, len(self.all_data)))
+                for index in [index for index in thumbnails if index not in prefetch_window]:
+                    thumbnails.pop(index).cancel()
+                for index in prefetch_window:
+                    if index not in thumbnails:
+                        thumbnails[index] = executor.submit(self.render_thumbnail, index)
+
+                page_images = self.all_data[start:end]
+                self.rejected_tiles = set()
+                key_code = self.display_mosaic([thumbnails[index].result() for index in range(start, end)])
+
+                if key_code == 43:
+                    # Add accepted tiles to dataset if the pressed key was "+" and move to next page
+                    added = [img for tile, img in enumerate(page_images) if tile not in self.rejected_tiles]
+                    self.verified_data += added
+                    actions[page] = len(added)
+                    print(f"Page {page}/{page_count}: {len(added)} of {len(page_images)} images were added to the dataset!")
+                    page += 1
+                elif key_code == 45:
+                    # Remove images of previous page from verified_data
+                    try:
+                        if actions[page - 1] > 0:
+                            del self.verified_data[-actions[page - 1]:]
+                            print(f"{actions[page - 1]} images of Page {page - 1}/{page_count} were removed from the dataset!")
+                        else:
+                            print(f"Moved back to Page {page - 1}!")
+                    except KeyError:
+                        print("Reached beginning of dataset!")
+                        continue
+                    page -= 1
+                else:
+                    # Skip page without adding any image to the dataset
+                    print(f"Page {page}/{page_count} was skipped!")
+                    actions[page] = 0
+                    page += 1
+
+    def render_thumbnail(self, index):
+        """
+        Creates a thumbnail of the provided image with the bounding boxes drawn on it. Thumbnails are cached in a thumbnails subfolder
+        next to the image. The file name contains a hash of the bounding boxes, so changed annotations result in a new thumbnail,
+        and the cached thumbnail is also rendered again if the image was exported again since.
+
+        Parameters
+        ----------
+        index : int
+            Index of the image in the loaded ExportTable.
+
+        Returns
+        -------
+        thumbnail : numpy.ndarray
+            Thumbnail image with the bounding boxes drawn on it.
+
+        """
+
+        file_name = str(self.all_data.file_names[index])
+        boxes = self.all_data.boxes_for(index)
+        boxes_hash = hashlib.sha1(boxes.tobytes()).hexdigest()[:12]
+        thumbnails_path = os.path.join(os.path.dirname(file_name), "thumbnails")
+        thumbnail_path = os.path.join(thumbnails_path, f"{Path(file_name).stem}_{self.thumb_width}_{boxes_hash}.jpg")
+        if os.path.isfile(thumbnail_path) and os.path.getmtime(thumbnail_path) >= os.path.getmtime(file_name):
+            thumbnail = cv2.imread(thumbnail_path)
+            # Unreadable thumbnails are rendered again
+            if thumbnail is not None:
+                return thumbnail
+
+        # Resize frame first and scale the boxes, so their lines stay visible on the thumbnail
+        frame = cv2.imread(file_name)
+        scale = self.thumb_width / frame.shape[1]
+        frame = cv2.resize(frame, (self.thumb_width, int(frame.shape[0] * scale)), interpolation=cv2.INTER_AREA)
+
+        # Draw rectangles
+        for left, top, right, bottom, _ in boxes.tolist():
+            cv2.rectangle(frame, (int(left * scale), int(top * scale)), (int(right * scale), int(bottom * scale)), (0, 255, 255), 1, 8)
+
+        # Write to a temporary file first, so an interrupted write never leaves a truncated thumbnail in the cache
+        os.makedirs(thumbnails_path, exist_ok=True)
+        temp_fd, temp_path = tempfile.mkstemp(suffix=".jpg", prefix="tmp_", dir=thumbnails_path)
+        os.close(temp_fd)
+        try:
+            if cv2.imwrite(temp_path, frame):
+                os.replace(temp_path, thumbnail_path)
+        finally:
+            if os.path.isfile(temp_path):
+                os.remove(temp_path)
+
+        return frame
+
+    def display_mosaic(self, thumbnails):
+        """
+        Arranges the provided thumbnails in a grid, crosses out the rejected ones and shows the grid on screen until a key is pressed.
+        The grid is composed once, and it is only redrawn when a click toggles a tile.
+
+        Parameters
+        ----------
+        thumbnails : list (numpy.ndarray)
+            Thumbnails of the current page.
+
+        Returns
+        -------
+        key_code : int
+            Code of the pressed key.
+
+        """
+
+        self.thumb_height = thumbnails[0].shape[0]
+        grid = np.zeros((self.grid_rows * self.thumb_height, self.grid_cols * self.thumb_width, 3), dtype=np.uint8)
+        for tile, thumbnail in enumerate(thumbnails):
+            # Thumbnails already have the tile width, only images with a different aspect ratio need resizing
+            if thumbnail.shape[0] != self.thumb_height:
+                thumbnail = cv2.resize(thumbnail, (self.thumb_width, self.thumb_height), interpolation=cv2.INTER_AREA)
+            top = (tile // self.grid_cols) * self.thumb_height
+            left = (tile % self.grid_cols) * self.thumb_width
+            grid[top:top + self.thumb_height, left:left + self.thumb_width] = thumbnail
+
+        self.mosaic_changed = True
+        while True:
+            if self.mosaic_changed:
+                self.mosaic_changed = False
+
+                # Cross out rejected tiles on a copy, so they can be toggled back
+                mosaic = grid.copy()
+                for tile in self.rejected_tiles:
+                    top = (tile // self.grid_cols) * self.thumb_height
+                    left = (tile % self.grid_cols) * self.thumb_width
+                    bottom, right = top + self.thumb_height - 1, left + self.thumb_width - 1
+                    cv2.line(mosaic, (left, top), (right, bottom), (0, 0, 255), 3)
+                    cv2.line(mosaic, (right, top), (left, bottom), (0, 0, 255), 3)
+
+                cv2.imshow("window", mosaic)
+                self.report_first_image()
+
+            # Poll the keyboard, so tiles toggled by clicks are redrawn while waiting
+            key_code = cv2.waitKey(50)
+            if key_code != -1:
+                return key_code
+
+    def display_image(self, index):
         """
         Shows the provided image on screen and draws the bounding boxes on it.
 
         Parameters
         ----------
-        img : object
-            Img object from the loaded JSON file. Contains the full path to the image under "file_name" key and
-            the annotations including bounding boxes under "annotations" key.
+        index : int
+            Index of the image in the loaded ExportTable. The full path to the image and the bounding boxes are read from the table.
 
         Returns
         -------
@@ -125,15 +336,14 @@ class Verify:
         """
 
         # Get frame
-        frame = cv2.imread(img["file_name"])
+        frame = cv2.imread(str(self.all_data.file_names[index]))
         frame_ratio = frame.shape[0] / frame.shape[1]
         resized_frame_dims = (1280, int(frame.shape[0] * frame_ratio))
 
         # Draw rectangles
-        for annotation in img["annotations"]:
-            bbox = [int(coord) for coord in annotation["bbox"]]
-            top_left = (bbox[0], bbox[1])
-            bottom_right = (bbox[2], bbox[3])
+        for left, top, right, bottom, _ in self.all_data.boxes_for(index).tolist():
+            top_left = (left, top)
+            bottom_right = (right, bottom)
             cv2.rectangle(
                 frame,
                 top_left,
@@ -146,10 +356,21 @@ class Verify:
         frame = cv2.resize(frame, resized_frame_dims, interpolation=cv2.INTER_AREA)
 
         cv2.imshow("window", frame)
+        self.report_first_image()
         key_code = cv2.waitKey(0)
 
         return key_code
 
+    def report_first_image(self):
+        """
+        Logs the time elapsed between startup and the first image shown on screen. Only the first call logs anything.
+
+        """
+
+        if self.launch_time is not None:
+            log_startup_time("verify", self.launch_time)
+            self.launch_time = None
+
     def export_to_dataset(self, manual_verification, train_ratio=0.8):
         """
         A function that aggregates images from one more more exports into a single dataset. There ware 2 ways to get which images from an export should be kept:
@@ -174,12 +395,16 @@ class Verify:
 
         if not manual_verification:
             # Instead of user input, get verified data from self.all_data by searching for each file already copied to dataset
+            # Map file names to the index of their first occurrence, so only the matched images are built as dicts
+            indices = {}
+            for index, file_name in enumerate(self.all_data.file_names.tolist()):
+                indices.setdefault(os.path.basename(file_name), index)
+
             verified_data = []
             for root, _, files in os.walk(dataset_path):
                 for file in files:
-                    img = next((item for item in self.all_data if os.path.basename(item["file_name"]) == file), None)
-                    if img is not None:
-                        verified_data.append(img)
+                    if file in indices:
+                        verified_data.append(self.all_data[indices[file]])
                 break  # Walk only the root directory
         else:
             # Get verified data from user input
@@ -201,7 +426,8 @@ class Verify:
 
         # Write annotations JSON file for train and val datasets and upload dataset
         for data_type in data:
-            self.storage.upload_dataset(dataset_path=os.path.join(dataset_path, data_type), only_json=not manual_verification)
+            if not self.offline:
+                self.storage.upload_dataset(dataset_path=os.path.join(dataset_path, data_type), only_json=not manual_verification)
             with open(os.path.join(dataset_path, data_type, "annotations.json"), "w") as outfile:
                 json.dump(data[data_type], outfile)
 
@@ -211,4 +437,4 @@ class Verify:
         print(f"{count_kept} of {count_total} copied to dataset. Kept Ratio: {count_kept / count_total:.2f}.")
 
 
-Verify().run()
+Verify(launch_time=launch_time).run(mosaic="--mosaic" in sys.argv[2:])
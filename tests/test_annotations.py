@@ -0,0 +1,155 @@
+import os
+import json
+import numpy as np
+from annotations import RECT_DTYPE, ExportTable, load_config, save_config, rectangles_from_list, rectangles_to_list, sidecar_path
+
+
+CONFIG = {
+    "rectangles": [[[120, 80], [220, 190], 0, 0], [[400, 300], [520, 410], 37, 1]],
+    "radius": 1000,
+    "max_angle": 120.0,
+    "export_interval": 18,
+    "export_offset": 3
+}
+
+
+def player_dicts(image_folder):
+    return [{
+        "file_name": os.path.join(image_folder, f"video.avi_{frame_index}.jpg"),
+        "width": 1920.0,
+        "height": 1080.0,
+        "image_id": f"video.avi_{frame_index}",
+        "annotations": [{
+            "bbox": [10 * box, 20 * box, 10 * box + 100, 20 * box + 90],
+            "bbox_mode": 0,
+            "category_id": box % 2
+        } for box in range((position + 1) % 4)]
+    } for position, frame_index in enumerate(range(0, 90, 18))]
+
+
+def write_json(path, data):
+    with open(path, "w") as outfile:
+        json.dump(data, outfile)
+
+
+def test_rectangles_round_trip():
+    rectangles = rectangles_from_list(CONFIG["rectangles"])
+
+    assert rectangles.dtype == RECT_DTYPE
+    assert rectangles_to_list(rectangles) == CONFIG["rectangles"]
+
+
+def test_config_round_trip(tmp_path):
+    json_path = str(tmp_path / "video.json")
+    write_json(json_path, CONFIG)
+
+    config = load_config(json_path)
+    save_config(json_path, config)
+
+    with open(json_path) as json_file:
+        assert json_file.read() == json.dumps(CONFIG)
+    assert os.path.isfile(sidecar_path(json_path))
+
+    config = load_config(json_path)
+    assert rectangles_to_list(config["rectangles"]) == CONFIG["rectangles"]
+    assert {key: value for key, value in config.items() if key != "rectangles"} == {key: value for key, value in CONFIG.items() if key != "rectangles"}
+
+
+def test_config_sidecar_ignored_when_json_changes_with_preserved_mtime(tmp_path):
+    json_path = str(tmp_path / "video.json")
+    write_json(json_path, CONFIG)
+    save_config(json_path, load_config(json_path))
+
+    # Replace the JSON like a copy preserving the modification time would
+    stat = os.stat(json_path)
+    write_json(json_path, {**CONFIG, "radius": 12000})
+    os.utime(json_path, ns=(stat.st_atime_ns, stat.st_mtime_ns))
+
+    assert load_config(json_path)["radius"] == 12000
+
+
+def test_export_round_trip(tmp_path):
+    dataset_dicts = player_dicts(str(tmp_path))
+    json_path = str(tmp_path / "video.avi.json")
+    write_json(json_path, dataset_dicts)
+
+    table = ExportTable.from_dicts(dataset_dicts)
+    assert [json.dumps(table.build_dict(i)) for i in range(len(table))] == [json.dumps(img) for img in dataset_dicts]
+    assert table.save(json_path)
+
+    # Loaded from the sidecar, the dicts are rebuilt from the arrays
+    table = ExportTable.load(json_path)
+    assert table.dicts == [None] * len(dataset_dicts)
+    assert json.dumps(list(table)) == json.dumps(dataset_dicts)
+
+
+def test_export_load_writes_sidecar(tmp_path):
+    dataset_dicts = player_dicts(str(tmp_path))
+    json_path = str(tmp_path / "video.avi.json")
+    write_json(json_path, dataset_dicts)
+
+    # Loading the JSON writes the sidecar and drops the original dicts
+    table = ExportTable.load(json_path)
+    assert os.path.isfile(sidecar_path(json_path))
+    assert table.dicts == [None] * len(dataset_dicts)
+    assert json.dumps(list(table)) == json.dumps(dataset_dicts)
+
+    with open(json_path) as json_file:
+        assert json_file.read() == json.dumps(dataset_dicts)
+
+
+def test_export_keeps_minimal_dicts(tmp_path):
+    dataset_dicts = [
+        {"file_name": str(tmp_path / "a.jpg"), "annotations": [{"bbox": [1, 2, 3, 4]}]},
+        {"file_name": str(tmp_path / "b.jpg")},
+        {"file_name": str(tmp_path / "c.jpg"), "annotations": [
+            {"bbox": [1, 2, 3]},
+            {"bbox": ["left", 2, 3, 4]},
+            {"bbox": [1, 2, 3, 2 ** 40]},
+            {"bbox": [5, 6, 7, 8], "category_id": 1}
+        ]}
+    ]
+    json_path = str(tmp_path / "minimal.json")
+    write_json(json_path, dataset_dicts)
+
+    table = ExportTable.load(json_path)
+
+    assert json.dumps(list(table)) == json.dumps(dataset_dicts)
+    assert table.boxes_for(0).tolist() == [(1, 2, 3, 4, 0)]
+    assert table.boxes_for(1).tolist() == []
+    assert table.boxes_for(2).tolist() == [(5, 6, 7, 8, 1)]
+    assert not os.path.isfile(sidecar_path(json_path))
+
+
+def test_export_keeps_dicts_of_other_schemas(tmp_path):
+    json_path = str(tmp_path / "video.avi.json")
+    write_json(json_path, player_dicts(str(tmp_path)))
+    ExportTable.load(json_path)
+
+    # Edit the JSON after the sidecar was written
+    dataset_dicts = player_dicts(str(tmp_path))
+    dataset_dicts[1]["annotations"][0]["bbox"] = [10.5, 20.25, 110.75, 110.0]
+    dataset_dicts[2]["annotations"][0]["bbox_mode"] = 1
+    dataset_dicts[3]["source"] = "hand edited"
+    write_json(json_path, dataset_dicts)
+
+    table = ExportTable.load(json_path)
+
+    assert json.dumps(list(table)) == json.dumps(dataset_dicts)
+    assert table.boxes_for(1)[0].tolist() == (10, 20, 110, 110, 0)
+    assert not table.save(json_path)
+    assert not os.path.isfile(sidecar_path(json_path))
+
+
+def test_concatenate(tmp_path):
+    first = ExportTable.from_dicts(player_dicts(str(tmp_path / "1")))
+    empty = ExportTable.from_dicts([])
+    second = ExportTable.from_dicts(player_dicts(str(tmp_path / "2")))
+
+    table = ExportTable.concatenate([first, empty, second])
+
+    assert len(table) == len(first) + len(second)
+    assert table.offsets[-1] == len(table.boxes)
+    for index in range(len(second)):
+        assert np.array_equal(table.boxes_for(len(first) + index), second.boxes_for(index))
+    assert list(table) == list(first) + list(second)
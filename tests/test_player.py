@@ -0,0 +1,46 @@
+import math
+import pytest
+from annotations import rectangles_from_list
+
+pytest.importorskip("cv2")
+from player import Player  # noqa: E402
+
+
+def baseline_position(player, old_rect_points, tracker_position):
+    """
+    Rectangle position calculation as it was done on the nested tuple representation of the rectangles.
+
+    """
+
+    half_w, half_h = player.frame_dims[0] / 2, player.frame_dims[1] / 2
+    box_w = old_rect_points[1][0] - old_rect_points[0][0]
+    box_h = old_rect_points[1][1] - old_rect_points[0][1]
+    angle_old = player.max_angle * old_rect_points[2] / player.total_frames
+    angle_new = player.max_angle * tracker_position / player.total_frames
+    x1 = old_rect_points[0][0] + box_w / 2
+    y1 = old_rect_points[0][1] + box_h / 2
+    gamma_old = math.atan((half_w - x1) / (player.radius + half_h - y1 + 0.000001))
+    polar_radius = (half_w - x1) / (math.sin(gamma_old) + 0.000001)
+    gamma_new = math.radians(math.degrees(gamma_old) + (angle_new - angle_old))
+    x2 = half_w - math.sin(gamma_new) * polar_radius
+    y2 = player.radius + half_h - (math.cos(gamma_new) * polar_radius)
+    return [(int(x2 - box_w / 2), int(y2 - box_h / 2)), (int(x2 + box_w / 2), int(y2 + box_h / 2)), old_rect_points[2], old_rect_points[3]]
+
+
+def test_rectangle_positions_match_tuple_representation():
+    # Only the attributes used by the calculation are set, so no window is opened
+    player = Player.__new__(Player)
+    player.frame_dims = (1040, 585)
+    player.radius = 1000
+    player.max_angle = 120.0
+    player.total_frames = 1800.0
+    player.tracker_position = 0
+
+    rectangles = [((left, top), (left + 80, top + 60), drawn_at, category)
+                  for left in range(20, 1000, 97) for top in range(15, 540, 83) for drawn_at in (0, 613, 1799) for category in (0, 1)]
+
+    for rectangle, record in zip(rectangles, rectangles_from_list(rectangles)):
+        for tracker_position in range(0, 1800, 157):
+            new_position = player.calc_new_rectangle_position(record, tracker_position=tracker_position)
+            assert new_position == baseline_position(player, rectangle, tracker_position)
+            assert all(type(value) is int for value in new_position[2:])
@@ -0,0 +1,16 @@
+import time
+from startup import log_startup_time
+
+
+def test_log_startup_time_appends_to_log(tmp_path):
+    log_path = str(tmp_path / "startup_times.csv")
+
+    first = log_startup_time("player", time.perf_counter() - 1.5, log_path=log_path)
+    log_startup_time("verify", time.perf_counter(), log_path=log_path)
+
+    with open(log_path) as log_file:
+        lines = log_file.read().splitlines()
+    assert first >= 1.5
+    assert lines[0] == "timestamp,tool,seconds"
+    assert [line.split(",")[1] for line in lines[1:]] == ["player", "verify"]
+    assert float(lines[1].split(",")[2]) >= 1.5
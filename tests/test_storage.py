@@ -0,0 +1,209 @@
+"""
+Tests of the Storage class against moto's in-memory S3 stand-in. To run them against a local S3 server (moto server or MinIO) instead,
+set S3_ENDPOINT_URL, the mock is not started in that case.
+
+"""
+
+import os
+import types
+import pytest
+import storage as storage_module
+from storage import Storage
+
+boto3 = pytest.importorskip("boto3")
+botocore_exceptions = pytest.importorskip("botocore.exceptions")
+ProtocolError = pytest.importorskip("urllib3.exceptions").ProtocolError
+moto = pytest.importorskip("moto")
+try:
+    mock_aws = moto.mock_aws
+except AttributeError:
+    mock_aws = moto.mock_s3
+
+
+KEY = "1/video.mp4"
+CONTENT = os.urandom(10 * 1024)
+
+
+@pytest.fixture
+def sleeps(monkeypatch):
+    delays = []
+    monkeypatch.setattr(storage_module.time, "sleep", delays.append)
+    return delays
+
+
+@pytest.fixture
+def storage(monkeypatch, sleeps):
+    monkeypatch.setenv("AWS_ACCESS_KEY_ID", "testing")
+    monkeypatch.setenv("AWS_SECRET_ACCESS_KEY", "testing")
+    monkeypatch.setenv("AWS_DEFAULT_REGION", "us-east-1")
+
+    endpoint_url = os.environ.get("S3_ENDPOINT_URL")
+    mock = mock_aws() if endpoint_url is None else None
+    if mock is not None:
+        mock.start()
+
+    s3 = boto3.resource("s3", endpoint_url=endpoint_url)
+    buckets = [s3.Bucket("sorterbot-training-videos"), s3.Bucket("sorterbot-datasets")]
+    for bucket in buckets:
+        bucket.create()
+    buckets[0].put_object(Key=KEY, Body=CONTENT)
+
+    yield Storage(endpoint_url=endpoint_url, max_retries=2, chunk_size=1024)
+
+    for bucket in buckets:
+        bucket.objects.all().delete()
+        bucket.delete()
+    if mock is not None:
+        mock.stop()
+
+
+def record_ranges(monkeypatch, storage, fail_first=False):
+    """
+    Records the Range of every GET request. If fail_first is set, the first response breaks with a connection reset after one chunk.
+
+    """
+
+    ranges = []
+    bucket = storage.videos_bucket
+    create_object = bucket.Object
+
+    def spy_object(key):
+        s3_object = create_object(key)
+        get = s3_object.get
+
+        def spy_get(**kwargs):
+            ranges.append(kwargs["Range"])
+            response = get(**kwargs)
+            if fail_first and len(ranges) == 1:
+                body = response["Body"]
+
+                def iter_chunks(chunk_size):
+                    yield next(body.iter_chunks(chunk_size=chunk_size))
+                    raise ProtocolError("Connection reset by peer")
+
+                response["Body"] = types.SimpleNamespace(iter_chunks=iter_chunks)
+            return response
+
+        s3_object.get = spy_get
+        return s3_object
+
+    monkeypatch.setattr(bucket, "Object", spy_object)
+    return ranges
+
+
+def read(path):
+    with open(path, "rb") as file:
+        return file.read()
+
+
+def test_download_file(storage, monkeypatch, tmp_path):
+    ranges = record_ranges(monkeypatch, storage)
+    file_path = str(tmp_path / "video.mp4")
+
+    storage.download_file(KEY, file_path)
+
+    assert read(file_path) == CONTENT
+    assert ranges == ["bytes=0-"]
+    assert sorted(os.listdir(tmp_path)) == ["video.mp4"]
+
+
+def test_download_file_resumes_partial_file(storage, monkeypatch, tmp_path):
+    ranges = record_ranges(monkeypatch, storage)
+    file_path = str(tmp_path / "video.mp4")
+    with open(f"{file_path}.part", "wb") as part_file:
+        part_file.write(CONTENT[:4096])
+    with open(f"{file_path}.part.etag", "w") as etag_file:
+        etag_file.write(storage.videos_bucket.Object(KEY).e_tag)
+
+    storage.download_file(KEY, file_path)
+
+    assert read(file_path) == CONTENT
+    assert ranges == ["bytes=4096-"]
+    assert sorted(os.listdir(tmp_path)) == ["video.mp4"]
+
+
+def test_download_file_retries_after_connection_reset(storage, monkeypatch, tmp_path):
+    ranges = record_ranges(monkeypatch, storage, fail_first=True)
+    file_path = str(tmp_path / "video.mp4")
+
+    storage.download_file(KEY, file_path)
+
+    assert read(file_path) == CONTENT
+    assert ranges == ["bytes=0-", "bytes=1024-"]
+
+
+def test_download_file_restarts_when_etag_does_not_match(storage, monkeypatch, tmp_path):
+    ranges = record_ranges(monkeypatch, storage)
+    file_path = str(tmp_path / "video.mp4")
+    with open(f"{file_path}.part", "wb") as part_file:
+        part_file.write(b"bytes of a previous version")
+    with open(f"{file_path}.part.etag", "w") as etag_file:
+        etag_file.write('"previous-version"')
+
+    storage.download_file(KEY, file_path)
+
+    assert read(file_path) == CONTENT
+    assert ranges == ["bytes=0-"]
+
+
+def test_download_file_restarts_without_stored_etag(storage, monkeypatch, tmp_path):
+    ranges = record_ranges(monkeypatch, storage)
+    file_path = str(tmp_path / "video.mp4")
+    with open(f"{file_path}.part", "wb") as part_file:
+        part_file.write(os.urandom(len(CONTENT)))
+
+    storage.download_file(KEY, file_path)
+
+    assert read(file_path) == CONTENT
+    assert ranges == ["bytes=0-"]
+
+
+def test_download_file_does_not_retry_missing_object(storage, sleeps, tmp_path):
+    with pytest.raises(botocore_exceptions.ClientError):
+        storage.download_file("1/missing.mp4", str(tmp_path / "missing.mp4"))
+
+    assert sleeps == []
+
+
+def test_download_videos(storage, tmp_path):
+    pytest.importorskip("ffmpy")
+    for key in ["1/other.mp4", "1/sub/nested.mp4", "2/video.mp4", "10/video.mp4"]:
+        storage.videos_bucket.put_object(Key=key, Body=key.encode())
+    videos_path = tmp_path / "1"
+    videos_path.mkdir()
+
+    # Already converted videos are not converted again, so ffmpeg is not needed
+    for name in ["video.avi", "other.avi"]:
+        (videos_path / name).touch()
+
+    storage.download_videos(str(videos_path))
+
+    assert sorted(os.listdir(videos_path)) == ["other.avi", "other.mp4", "video.avi", "video.mp4"]
+    assert read(videos_path / "video.mp4") == CONTENT
+    assert read(videos_path / "other.mp4") == b"1/other.mp4"
+
+
+def test_download_videos_raises_failed_download(storage, monkeypatch, tmp_path):
+    def fail(obj, videos_path):
+        raise IOError(f"Download of {obj} failed.")
+
+    monkeypatch.setattr(storage, "download_and_convert_video", fail)
+
+    with pytest.raises(IOError):
+        storage.download_videos(str(tmp_path / "1"))
+
+
+@pytest.mark.parametrize("only_json, expected_keys", [
+    (False, ["1-2/train/annotations.json", "1-2/train/video.avi_0.jpg"]),
+    (True, ["1-2/train/annotations.json"])
+])
+def test_upload_dataset(storage, tmp_path, only_json, expected_keys):
+    dataset_path = tmp_path / "datasets" / "1-2" / "train"
+    (dataset_path / "subfolder").mkdir(parents=True)
+    (dataset_path / "annotations.json").write_text("[]")
+    (dataset_path / "video.avi_0.jpg").write_bytes(b"jpg")
+    (dataset_path / "subfolder" / "ignored.jpg").write_bytes(b"jpg")
+
+    storage.upload_dataset(str(dataset_path), only_json=only_json)
+
+    assert sorted(obj.key for obj in storage.datasets_bucket.objects.all()) == expected_keys